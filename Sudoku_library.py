@@ -0,0 +1,351 @@
+import argparse
+import contextlib
+import hashlib
+import heapq
+import json
+import os
+import tempfile
+from itertools import permutations, product
+
+DIMENSION = 9  # Sudoku is 9x9
+HASH_LENGTH = 16  # hex characters of the compact puzzle hash
+RECORD_LENGTH = HASH_LENGTH + 1 + DIMENSION*DIMENSION + 1  # "<hash> <canonical>\n"
+CHUNK_SIZE = 100000  # puzzles kept in memory while building a sorted run
+MAX_FAN_IN = 64  # runs merged at once, bounds the number of open files
+
+# All column orders that keep the stacks intact: 3! stack orders times 3! column orders per stack
+COLUMN_ORDERS = [[stack*3+c for stack, inner in zip(stacks, inners) for c in inner]
+                 for stacks in permutations(range(3))
+                 for inners in product(permutations(range(3)), repeat=3)]
+
+
+def parse_puzzle(line):
+    """Parses a puzzle stored as a list of lists (as in Sudoku.txt) or as a string of 81 digits."""
+    line = line.strip()
+    if line.startswith("["):
+        board = json.loads(line)
+        if not all(isinstance(row, list) for row in board):
+            raise ValueError("A sudoku must be a list of lists.")
+        if any(type(v) is not int for row in board for v in row):  # no floats, booleans or nulls
+            raise ValueError("A sudoku may only contain the numbers 0 to 9.")
+    else:
+        values = [0 if v == "." else int(v) for v in line]
+        if len(values) != DIMENSION*DIMENSION:
+            raise ValueError("A sudoku must have 81 digits.")
+        board = [values[r*DIMENSION:(r+1)*DIMENSION] for r in range(DIMENSION)]
+    if len(board) != DIMENSION or any(len(row) != DIMENSION for row in board):
+        raise ValueError("A sudoku must be a 9x9 grid.")
+    if any(v < 0 or v > 9 for row in board for v in row):
+        raise ValueError("A sudoku may only contain the numbers 0 to 9.")
+    return board
+
+
+def canonical_form(board):
+    """Returns the canonical form of a puzzle as a string of 81 digits.
+
+    Two puzzles get the same canonical form when one can be turned into the other by relabelling
+    the numbers, transposing, swapping bands or stacks, or swapping rows or columns within a band
+    or stack. The canonical form is the smallest of these variants read row by row, with the
+    numbers relabelled in order of first appearance.
+    """
+    grid = tuple(tuple(int(v) for v in row) for row in board)
+    starts = []
+    for g in (grid, tuple(zip(*grid))):
+        seen = set()
+        for r in range(DIMENSION):
+            if (r//3, g[r]) in seen:  # equal rows in the same band lead to the same grids
+                continue
+            seen.add((r//3, g[r]))
+            first, orders = first_row_orders(g[r])
+            starts.append((first, g, r, orders))
+
+    # only the smallest first rows, and the column orders giving them, can start the canonical form
+    low = min(start[0] for start in starts)
+    best = None
+    for first, g, r, orders in starts:
+        if first != low:
+            continue
+        columns = tuple(zip(*g))
+        seen = set()
+        for order in orders:
+            ordered = tuple(columns[c] for c in order)
+            if ordered in seen:  # swapping equal columns gives the same grid
+                continue
+            seen.add(ordered)
+            rows = list(zip(*ordered))
+            _, mapping = relabel(rows[r], {})
+            best = search_rows(rows, 1, r//3, frozenset([r]), mapping, (first,), best)
+    return "".join(str(v) for row in best for v in row)
+
+
+def first_row_orders(row):
+    """Returns the smallest relabelled version of a row and the column orders that give it."""
+    values = [v for v in row if v != 0]
+    if len(values) != len(set(values)):  # numbers repeat, so try all column orders
+        labelled = {}
+        for order in COLUMN_ORDERS:
+            labelled.setdefault(relabel([row[c] for c in order], {})[0], []).append(order)
+        first = min(labelled)
+        return first, labelled[first]
+
+    # with distinct numbers only the empty cells matter: they go first within each stack and
+    # stacks with more empty cells go first
+    inners = []
+    for stack in range(3):
+        empty = [c for c in range(stack*3, stack*3+3) if row[c] == 0]
+        filled = [c for c in range(stack*3, stack*3+3) if row[c] != 0]
+        inners.append([list(a) + list(b) for a in permutations(empty) for b in permutations(filled)])
+    counts = [sum(1 for c in range(stack*3, stack*3+3) if row[c] == 0) for stack in range(3)]
+    stack_orders = [stacks for stacks in permutations(range(3))
+                    if all(counts[a] >= counts[b] for a, b in zip(stacks, stacks[1:]))]
+    orders = [[c for stack, inner in zip(stacks, chosen) for c in inner]
+              for stacks in stack_orders
+              for chosen in product(*(inners[stack] for stack in stacks))]
+    return relabel([row[c] for c in orders[0]], {})[0], orders
+
+
+def search_rows(rows, i, band, used, mapping, prefix, best):
+    """Picks the row order giving the smallest relabelled grid, skipping prefixes worse than the best."""
+    if i == DIMENSION:
+        return prefix if best is None or prefix < best else best
+
+    if i % 3 == 0:  # start a new band with any row of an unused band
+        used_bands = {r//3 for r in used}
+        candidates = [r for r in range(DIMENSION) if r//3 not in used_bands]
+    else:  # finish the current band
+        candidates = [r for r in range(band*3, band*3+3) if r not in used]
+
+    options = []
+    seen = set()
+    for r in candidates:
+        if (r//3, rows[r]) in seen:  # equal rows in the same band lead to the same grids
+            continue
+        seen.add((r//3, rows[r]))
+        labelled, new_mapping = relabel(rows[r], mapping)
+        options.append((labelled, new_mapping, r))
+    low = min(option[0] for option in options)
+    if best is not None and prefix + (low,) > best[:i+1]:
+        return best
+
+    for labelled, new_mapping, r in options:
+        if labelled == low:
+            best = search_rows(rows, i+1, r//3, used | {r}, new_mapping, prefix + (labelled,), best)
+    return best
+
+
+def relabel(row, mapping):
+    """Relabels a row, numbering unseen numbers in order of first appearance."""
+    labelled = []
+    for v in row:
+        if v != 0 and v not in mapping:
+            mapping = dict(mapping)
+            mapping[v] = len(mapping) + 1
+        labelled.append(mapping.get(v, 0))
+    return tuple(labelled), mapping
+
+
+def puzzle_hash(canonical):
+    """Returns the compact hash of a canonical form."""
+    return hashlib.blake2b(canonical.encode(), digest_size=HASH_LENGTH//2).hexdigest()
+
+
+def read_puzzles(paths):
+    """Yields (line number, board) for every puzzle in the given corpus files, one puzzle per line."""
+    for path in paths:
+        with open(path, "r") as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield number, parse_puzzle(line)
+                except ValueError as e:
+                    raise ValueError("{}:{}: {}".format(path, number, e))
+
+
+class PuzzleIndex:
+
+    def __init__(self, path):
+        """Inits the index from a file of fixed width records sorted by hash and canonical form."""
+        self.path = path
+        self.f = open(path, "rb")
+        size = os.fstat(self.f.fileno()).st_size
+        if size % RECORD_LENGTH != 0:
+            self.f.close()
+            raise ValueError("{} is not a puzzle index.".format(path))
+        self.size = size // RECORD_LENGTH
+
+    def __len__(self):
+        """Returns the number of unique puzzles in the index."""
+        return self.size
+
+    def __contains__(self, board):
+        """Checks whether a puzzle (or a relabelled or rotated copy of it) is in the index."""
+        return self.lookup(canonical_form(board))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def record(self, position):
+        """Reads the (hash, canonical form) record at the given position."""
+        self.f.seek(position*RECORD_LENGTH)
+        record = self.f.read(RECORD_LENGTH).decode()
+        return record[:HASH_LENGTH], record[HASH_LENGTH+1:-1]
+
+    def lookup(self, canonical):
+        """Binary searches the index for a canonical form, reading O(log n) records from disk."""
+        key = (puzzle_hash(canonical), canonical)
+        low, high = 0, self.size
+        while low < high:
+            middle = (low+high) // 2
+            if self.record(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low < self.size and self.record(low) == key
+
+    def close(self):
+        """Closes the index file."""
+        self.f.close()
+
+
+def write_run(records, directory):
+    """Sorts a chunk of records and writes it to a temporary run file."""
+    records.sort()
+    fd, path = tempfile.mkstemp(suffix=".run", dir=directory)
+    with os.fdopen(fd, "w") as f:
+        f.writelines(records)
+    return path
+
+
+def merge_runs(paths, directory):
+    """Merges sorted run files into a single sorted run file."""
+    files = [open(path, "r") for path in paths]
+    fd, merged = tempfile.mkstemp(suffix=".run", dir=directory)
+    with os.fdopen(fd, "w") as f:
+        f.writelines(heapq.merge(*files))
+    for file, path in zip(files, paths):
+        file.close()
+        os.remove(path)
+    return merged
+
+
+def deduplicate(corpus_paths, output_path, index_path, chunk_size=CHUNK_SIZE, tmp_dir=None):
+    """Removes duplicate puzzles from the corpus files and writes the library and its index.
+
+    The corpus is sorted on disk: chunks of at most chunk_size puzzles are sorted in memory and
+    written to run files, which are then merged. Of every set of duplicates the first puzzle in
+    the corpus is kept. The library is written in the order of the index (sorted by hash), not in
+    the order of the corpus. The run files go to tmp_dir, which defaults to the directory of the
+    library, as the system temp directory is often kept in memory. Returns the number of puzzles
+    read and the number of unique puzzles.
+    """
+    if chunk_size < 1:
+        raise ValueError("The chunk size must be at least 1.")
+    if tmp_dir is None:
+        tmp_dir = os.path.dirname(os.path.abspath(output_path))
+    total = unique = 0
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as directory:
+        runs = []
+        records = []
+        for total, (_, board) in enumerate(read_puzzles(corpus_paths), 1):
+            canonical = canonical_form(board)
+            # the sequence number makes the first occurrence sort first among its duplicates
+            records.append("{} {} {:012d} {}\n".format(puzzle_hash(canonical), canonical, total,
+                                                       json.dumps(board)))
+            if len(records) >= chunk_size:
+                runs.append(write_run(records, directory))
+                records = []
+        if records or not runs:
+            runs.append(write_run(records, directory))
+        records = []
+
+        while len(runs) > 1:
+            runs = [merge_runs(runs[i:i+MAX_FAN_IN], directory)
+                    for i in range(0, len(runs), MAX_FAN_IN)]
+
+        # the corpus files are fully read, so the library may replace one of them
+        library_tmp = output_path + ".tmp"
+        index_tmp = index_path + ".tmp"
+        try:
+            # the index is read as fixed width records, so never write "\r\n" line endings
+            with open(runs[0], "r") as run, open(library_tmp, "w") as library, \
+                    open(index_tmp, "w", newline="\n") as index:
+                previous = None
+                for line in run:
+                    key = line[:RECORD_LENGTH-1]
+                    board = line.split(" ", 3)[3]
+                    if key == previous:
+                        continue
+                    previous = key
+                    unique += 1
+                    library.write(board)
+                    index.write(key + "\n")
+            os.replace(library_tmp, output_path)
+            os.replace(index_tmp, index_path)
+        finally:
+            for path in (library_tmp, index_tmp):
+                if os.path.exists(path):
+                    os.remove(path)
+    return total, unique
+
+
+def check(corpus_paths, index_path, output_path=None):
+    """Checks every puzzle against the index and optionally writes the puzzles that are not in it.
+
+    Yields (path, line number, hash, known) for every puzzle. Copies of a new puzzle within the
+    checked files are all written, run dedupe on the written file to remove them.
+    """
+    with contextlib.ExitStack() as stack:
+        index = stack.enter_context(PuzzleIndex(index_path))
+        new = stack.enter_context(open(output_path, "w")) if output_path else None
+        for path in corpus_paths:
+            for number, board in read_puzzles([path]):
+                canonical = canonical_form(board)
+                known = index.lookup(canonical)
+                if new and not known:
+                    new.write(json.dumps(board) + "\n")
+                yield path, number, puzzle_hash(canonical), known
+
+
+def positive_int(value):
+    """Parses a command line value that must be a positive integer."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("{} is not a positive integer".format(value))
+    return number
+
+
+def main():
+    """Command line interface to deduplicate a puzzle library and to check new puzzles against it."""
+    parser = argparse.ArgumentParser(description="Deduplicate sudoku corpora and check puzzles against a library.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    dedupe = commands.add_parser("dedupe", help="remove duplicate puzzles and write the library and its index")
+    dedupe.add_argument("corpus", nargs="+", help="files with one puzzle per line")
+    dedupe.add_argument("-o", "--output", required=True, help="library file to write")
+    dedupe.add_argument("-i", "--index", required=True, help="index file to write")
+    dedupe.add_argument("--chunk-size", type=positive_int, default=CHUNK_SIZE, help="puzzles sorted in memory at once")
+    dedupe.add_argument("--tmp-dir", help="directory for the sorted runs, defaults to the directory of the library")
+
+    lookup = commands.add_parser("check", help="check puzzles against the index of a library")
+    lookup.add_argument("corpus", nargs="+", help="files with one puzzle per line")
+    lookup.add_argument("-i", "--index", required=True, help="index file of the library")
+    lookup.add_argument("-o", "--output", help="file to write the puzzles that are not in the library")
+
+    args = parser.parse_args()
+    try:
+        if args.command == "dedupe":
+            total, unique = deduplicate(args.corpus, args.output, args.index, args.chunk_size, args.tmp_dir)
+            print("{} puzzles read, {} unique puzzles written to {}".format(total, unique, args.output))
+        else:
+            for path, number, code, known in check(args.corpus, args.index, args.output):
+                print("{}:{} {} {}".format(path, number, code, "known" if known else "new"))
+    except (ValueError, OSError) as e:
+        parser.error(str(e))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import json
+import random
+import sys
+
+import pytest
+
+import Sudoku_library
+from Sudoku_library import RECORD_LENGTH, PuzzleIndex, canonical_form, check, deduplicate, parse_puzzle, puzzle_hash
+
+BOARD = [[0, 7, 0, 1, 8, 0, 9, 0, 6], [0, 0, 0, 0, 0, 2, 0, 1, 7], [0, 0, 0, 0, 9, 0, 2, 0, 0],
+         [0, 5, 0, 2, 0, 0, 0, 7, 0], [4, 0, 6, 0, 0, 0, 5, 0, 8], [0, 1, 0, 0, 0, 8, 0, 2, 0],
+         [0, 0, 5, 0, 1, 0, 0, 0, 0], [2, 6, 0, 9, 0, 0, 0, 0, 0], [8, 0, 3, 0, 2, 5, 0, 6, 0]]
+
+
+def variant(board, rng):
+    """Returns a random relabelled, transposed and band/stack/row/column swapped copy of a board."""
+    labels = [0] + rng.sample(range(1, 10), 9)
+    grid = [[labels[v] for v in row] for row in board]
+    if rng.random() < 0.5:
+        grid = [list(col) for col in zip(*grid)]
+    rows = [band*3+r for band in rng.sample(range(3), 3) for r in rng.sample(range(3), 3)]
+    cols = [stack*3+c for stack in rng.sample(range(3), 3) for c in rng.sample(range(3), 3)]
+    return [[grid[r][c] for c in cols] for r in rows]
+
+
+def distinct_boards():
+    """Returns puzzles that are not copies of each other."""
+    boards = [BOARD]
+    for row, col in [(0, 0), (0, 2), (4, 4), (8, 8)]:
+        board = [r[:] for r in BOARD]
+        board[row][col] = 0 if board[row][col] else 3
+        boards.append(board)
+    return boards
+
+
+def write_corpus(path, boards):
+    with open(path, "w") as f:
+        for board in boards:
+            f.write(json.dumps(board) + "\n")
+
+
+DIGITS = "".join(str(v) for row in BOARD for v in row)
+
+
+@pytest.mark.parametrize("line", [json.dumps(BOARD), DIGITS, DIGITS.replace("0", ".") + "\n"])
+def test_parse_puzzle(line):
+    assert parse_puzzle(line) == BOARD
+
+
+@pytest.mark.parametrize("line", [DIGITS[:80], DIGITS + "0", "1"*90, DIGITS[:80] + "x", "[1,2]", "[[1,2]]",
+                                  json.dumps(BOARD[:8] + [[1.7]*9]), json.dumps(BOARD[:8] + [[None]*9]),
+                                  json.dumps(BOARD[:8] + [[True]*9]), json.dumps(BOARD[:8] + [[10]*9]),
+                                  json.dumps(BOARD)[:-1]])
+def test_parse_puzzle_rejects_malformed_lines(line):
+    with pytest.raises(ValueError):
+        parse_puzzle(line)
+
+
+def test_canonical_form_is_invariant_under_transforms():
+    rng = random.Random(0)
+    repeated = [[1, 1, 0, 2, 0, 2, 3, 0, 3]] + BOARD[1:]  # invalid rows may repeat numbers
+    for board in (BOARD, [[0]*9 for _ in range(9)], repeated):
+        canonical = canonical_form(board)
+        for _ in range(20):
+            assert canonical_form(variant(board, rng)) == canonical
+
+
+def test_different_puzzles_have_different_canonical_forms():
+    forms = [canonical_form(board) for board in distinct_boards()]
+    assert len(set(forms)) == len(forms)
+
+
+def test_deduplicate_keeps_first_occurrence(tmp_path, monkeypatch):
+    monkeypatch.setattr(Sudoku_library, "MAX_FAN_IN", 2)  # force several merge passes
+    rng = random.Random(1)
+    corpus = [variant(board, rng) for _ in range(6) for board in distinct_boards()]
+    write_corpus(tmp_path / "corpus.txt", corpus)
+
+    total, unique = deduplicate([str(tmp_path / "corpus.txt")], str(tmp_path / "library.txt"),
+                                str(tmp_path / "library.idx"), chunk_size=2)
+
+    assert (total, unique) == (len(corpus), len(distinct_boards()))
+    with open(tmp_path / "library.txt") as f:
+        library = [json.loads(line) for line in f]
+    firsts = {}
+    for board in corpus:
+        firsts.setdefault(canonical_form(board), board)
+    assert sorted(map(json.dumps, library)) == sorted(map(json.dumps, firsts.values()))
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_lookup_finds_first_and_last_records(tmp_path):
+    write_corpus(tmp_path / "corpus.txt", distinct_boards())
+    deduplicate([str(tmp_path / "corpus.txt")], str(tmp_path / "library.txt"), str(tmp_path / "library.idx"))
+
+    with PuzzleIndex(str(tmp_path / "library.idx")) as index:
+        assert len(index) == len(distinct_boards())
+        assert (tmp_path / "library.idx").stat().st_size == len(index) * RECORD_LENGTH
+        for position in (0, len(index)-1):
+            _, canonical = index.record(position)
+            assert index.lookup(canonical)
+        assert index.lookup(canonical_form(variant(BOARD, random.Random(2))))
+        assert not index.lookup(canonical_form([[0]*9 for _ in range(9)]))
+
+
+def test_lookup_on_empty_index(tmp_path):
+    (tmp_path / "empty.idx").write_text("")
+    with PuzzleIndex(str(tmp_path / "empty.idx")) as index:
+        assert len(index) == 0
+        assert not index.lookup(canonical_form(BOARD))
+        assert BOARD not in index
+
+
+def test_index_with_wrong_size_is_rejected(tmp_path):
+    (tmp_path / "bad.idx").write_text("x")
+    with pytest.raises(ValueError):
+        PuzzleIndex(str(tmp_path / "bad.idx"))
+
+
+def test_check_reports_known_and_new_puzzles(tmp_path):
+    known, new = distinct_boards()[:2]
+    write_corpus(tmp_path / "library.txt", [known])
+    deduplicate([str(tmp_path / "library.txt")], str(tmp_path / "library.txt"), str(tmp_path / "library.idx"))
+    rng = random.Random(3)
+    copy = variant(known, rng)
+    write_corpus(tmp_path / "import.txt", [copy, new, new])
+
+    results = list(check([str(tmp_path / "import.txt")], str(tmp_path / "library.idx"), str(tmp_path / "unseen.txt")))
+
+    path = str(tmp_path / "import.txt")
+    code = puzzle_hash(canonical_form(new))
+    assert results == [(path, 1, puzzle_hash(canonical_form(known)), True), (path, 2, code, False),
+                       (path, 3, code, False)]
+    with open(tmp_path / "unseen.txt") as f:
+        assert [json.loads(line) for line in f] == [new, new]
+
+
+def test_main_check(tmp_path, monkeypatch, capsys):
+    write_corpus(tmp_path / "library.txt", [BOARD])
+    deduplicate([str(tmp_path / "library.txt")], str(tmp_path / "library.txt"), str(tmp_path / "library.idx"))
+    write_corpus(tmp_path / "import.txt", [BOARD, distinct_boards()[1]])
+    monkeypatch.setattr(sys, "argv", ["Sudoku_library.py", "check", str(tmp_path / "import.txt"),
+                                      "-i", str(tmp_path / "library.idx")])
+
+    Sudoku_library.main()
+
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split()[-1] for line in lines] == ["known", "new"]
+    assert lines[0].startswith(str(tmp_path / "import.txt") + ":1 ")
+
+
+def test_main_reports_malformed_lines(tmp_path, monkeypatch, capsys):
+    (tmp_path / "corpus.txt").write_text("[1,2]\n")
+    monkeypatch.setattr(sys, "argv", ["Sudoku_library.py", "dedupe", str(tmp_path / "corpus.txt"),
+                                      "-o", str(tmp_path / "library.txt"), "-i", str(tmp_path / "library.idx")])
+
+    with pytest.raises(SystemExit):
+        Sudoku_library.main()
+    assert "corpus.txt:1" in capsys.readouterr().err